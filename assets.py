@@ -0,0 +1,81 @@
+import io, os, time
+from urllib.parse import urlparse, parse_qs
+import discord
+
+# images/gifs the bot posts. the bytes are read from disk once, and after the first upload
+# we just post the attachment's cdn link again (discord embeds it) until it expires or the
+# message holding the upload gets deleted
+
+defaultTtl = 12 * 3600
+
+def urlExpiry(url, now):
+    # signed cdn links carry their expiry as a hex unix timestamp in ?ex=
+    try:
+        return int(parse_qs(urlparse(url).query)['ex'][0], 16)
+    except (KeyError, IndexError, ValueError):
+        return now + defaultTtl
+
+class Asset:
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.data = None
+        self.url = None
+        self.expires = 0
+        self.messageId = None # the message the link points into, deleting it kills the link
+
+    def read(self):
+        if self.data is None:
+            with open(self.path, 'rb') as f:
+                self.data = f.read()
+        return self.data
+
+    def file(self):
+        return discord.File(io.BytesIO(self.read()), filename=self.filename)
+
+class AssetCache:
+    def __init__(self, debounce=3, margin=300):
+        self.assets = {}
+        self.debounce = debounce # seconds during which repeat sends asking for it get dropped
+        self.margin = margin # stop reusing a link this long before it expires
+        self._inflight = set()
+        self._last = {}
+
+    def register(self, name, path):
+        self.assets[name] = Asset(path)
+
+    def messagesDeleted(self, ids):
+        # the upload a link points into is gone, upload again next time
+        ids = set(ids)
+        for asset in self.assets.values():
+            if asset.messageId in ids:
+                asset.url = None
+                asset.expires = 0
+                asset.messageId = None
+
+    async def send(self, channel, name, debounce=False):
+        # returns the sent message, or None when this call got coalesced into another one.
+        # sends to the same channel that overlap always coalesce, debounce=True also drops
+        # the ones that come in shortly after
+        key = (channel.id, name)
+        now = time.monotonic()
+        if key in self._inflight or (debounce and now - self._last.get(key, -self.debounce) < self.debounce):
+            return None
+        self._inflight.add(key)
+        try:
+            msg = await self._send(channel, self.assets[name])
+        finally:
+            self._inflight.discard(key)
+            self._last[key] = time.monotonic()
+        return msg
+
+    async def _send(self, channel, asset):
+        now = time.time()
+        if asset.url is not None and now < asset.expires - self.margin:
+            return await channel.send(asset.url)
+        msg = await channel.send(file=asset.file())
+        if msg.attachments:
+            asset.url = msg.attachments[0].url
+            asset.expires = urlExpiry(asset.url, now)
+            asset.messageId = msg.id
+        return msg
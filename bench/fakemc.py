@@ -0,0 +1,137 @@
+# a tiny fake minecraft server for trying the native status backend offline:
+# answers the server list ping over tcp and the query protocol over udp
+# run with `python bench/fakemc.py --port 25565 --players alice bob`, or use FakeMinecraft from code
+import argparse, asyncio, json
+
+def writeVarint(value):
+    out = b''
+    value &= 0xFFFFFFFF
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out += bytes([byte | 0x80])
+        else:
+            return out + bytes([byte])
+
+async def readVarint(reader):
+    value = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value
+    raise ValueError('varint too long')
+
+def packet(packetId, data):
+    body = writeVarint(packetId) + data
+    return writeVarint(len(body)) + body
+
+class FakeMinecraft:
+    def __init__(self, players=(), mods=(), sampleSize=12, query=True, version='1.19.2', maxPlayers=20):
+        self.players = list(players)
+        self.mods = list(mods)
+        self.sampleSize = sampleSize # real servers only put 12 names in the ping
+        self.query = query
+        self.version = version
+        self.maxPlayers = maxPlayers
+        self.statusRequests = 0
+        self.queryRequests = 0
+        self._tcp = None
+        self._udp = None
+        self.port = None
+
+    def statusJson(self):
+        status = {
+            'version': {'name': self.version, 'protocol': 760},
+            'players': {
+                'online': len(self.players), 'max': self.maxPlayers,
+                'sample': [{'name': p, 'id': f'00000000-0000-0000-0000-{i + 1:012d}'} for i, p in enumerate(self.players[:self.sampleSize])],
+            },
+            'description': {'text': 'fake milkyway'},
+        }
+        if self.mods:
+            status['forgeData'] = {'mods': [{'modId': m, 'modmarker': '1.0'} for m in self.mods], 'fmlNetworkVersion': 3}
+        return json.dumps(status)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                length = await readVarint(reader)
+                data = await reader.readexactly(length)
+                packetId = data[0]
+                if packetId == 0 and len(data) > 1:
+                    continue # handshake, we only do status anyway
+                if packetId == 0:
+                    self.statusRequests += 1
+                    body = self.statusJson().encode()
+                    writer.write(packet(0, writeVarint(len(body)) + body))
+                elif packetId == 1:
+                    writer.write(packet(1, data[1:]))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _queryReply(self, data):
+        if len(data) < 7 or data[:2] != b'\xfe\xfd':
+            return None
+        kind, session = data[2], data[3:7]
+        if kind == 9:
+            return b'\x09' + session + b'9513307\x00'
+        self.queryRequests += 1
+        info = {
+            'hostname': 'fake milkyway', 'gametype': 'SMP', 'game_id': 'MINECRAFT', 'version': self.version,
+            'plugins': '', 'map': 'world', 'numplayers': str(len(self.players)), 'maxplayers': str(self.maxPlayers),
+            'hostport': str(self.port), 'hostip': '127.0.0.1',
+        }
+        out = b'\x00' + session + b'splitnum\x00\x80\x00'
+        for key, value in info.items():
+            out += key.encode() + b'\x00' + value.encode() + b'\x00'
+        out += b'\x00\x01player_\x00\x00'
+        for p in self.players:
+            out += p.encode() + b'\x00'
+        return out + b'\x00'
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._tcp = await asyncio.start_server(self._handle, host, port)
+        self.port = self._tcp.sockets[0].getsockname()[1]
+        if self.query:
+            fake = self
+
+            class Query(asyncio.DatagramProtocol):
+                def connection_made(self, transport):
+                    self.transport = transport
+
+                def datagram_received(self, data, addr):
+                    reply = fake._queryReply(data)
+                    if reply is not None:
+                        self.transport.sendto(reply, addr)
+
+            self._udp, _ = await asyncio.get_event_loop().create_datagram_endpoint(Query, local_addr=(host, self.port))
+        return self
+
+    @property
+    def address(self):
+        return f'127.0.0.1:{self.port}'
+
+    async def stop(self):
+        if self._udp is not None:
+            self._udp.close()
+        self._tcp.close()
+        await self._tcp.wait_closed()
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=25565)
+    parser.add_argument('--players', nargs='*', default=[])
+    parser.add_argument('--mods', nargs='*', default=[])
+    parser.add_argument('--no-query', action='store_true')
+    args = parser.parse_args()
+    server = await FakeMinecraft(args.players, args.mods, query=not args.no_query).start(port=args.port)
+    print(f'fake server on {server.address}')
+    await asyncio.Event().wait()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+# stand-ins for the bits of discord.py the bot touches, so main.py can run without the gateway.
+# every outbound api call is counted in `calls` and can be slowed down or made to fail
+import asyncio, collections, itertools, random, time
+
+discordEpoch = 1420070400000
+calls = collections.Counter()
+_counter = itertools.count()
+
+def snowflake(when=None):
+    ms = int((time.time() if when is None else when) * 1000)
+    return ((ms - discordEpoch) << 22) | (next(_counter) & 0x3FFFFF)
+
+class FakeHTTPException(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f'fake {status}')
+        self.status = status
+        self.retry_after = retry_after
+
+class Api:
+    # shared knobs for every fake call
+    def __init__(self, latency=0.0, jitter=0.0, errorRate=0.0, rateLimitRate=0.0, retryAfter=0.25):
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.rateLimitRate = rateLimitRate
+        self.retryAfter = retryAfter
+
+    async def call(self, kind):
+        calls[kind] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = random.random()
+        if roll < self.rateLimitRate:
+            # discord.py sleeps through 429s on its own, so the caller only sees the delay
+            calls['429'] += 1
+            await asyncio.sleep(self.retryAfter)
+        elif roll < self.rateLimitRate + self.errorRate:
+            calls['error'] += 1
+            raise FakeHTTPException(500)
+
+api = Api()
+
+class FakeRole:
+    def __init__(self, id):
+        self.id = id
+
+class FakeUser:
+    def __init__(self, id, name, discriminator='0001', avatar=None, roles=()):
+        self.id = id
+        self.name = name
+        self.discriminator = discriminator
+        self.avatar = avatar
+        self.roles = [FakeRole(r) for r in roles]
+        self.guild = None
+
+    def __str__(self):
+        return f'{self.name}#{self.discriminator}'
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeAttachment:
+    def __init__(self, filename):
+        expires = int(time.time()) + 24 * 3600
+        self.filename = filename
+        self.url = f'https://cdn.example/attachments/{snowflake()}/{filename}?ex={expires:x}'
+
+class FakeMessage:
+    def __init__(self, content, author, channel, id=None, attachments=()):
+        self.id = id or snowflake()
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.attachments = list(attachments)
+        self.reactions = []
+        self.deleted = False
+
+    async def delete(self):
+        await api.call('delete')
+        self.deleted = True
+        self.channel.messages.pop(self.id, None)
+
+    async def add_reaction(self, emoji):
+        await api.call('add_reaction')
+        self.reactions.append(emoji)
+
+class FakePartialMessage:
+    def __init__(self, channel, id):
+        self.channel = channel
+        self.id = id
+
+    async def delete(self):
+        await api.call('delete')
+        self.channel.messages.pop(self.id, None)
+
+class FakeChannel:
+    def __init__(self, id, guild=None, keep=1000):
+        self.id = id
+        self.guild = guild
+        self.messages = collections.OrderedDict() # what the bot and the replay posted, newest last
+        self.keep = keep
+        self.sent = []
+
+    def _remember(self, message):
+        self.messages[message.id] = message
+        while len(self.messages) > self.keep:
+            self.messages.popitem(last=False)
+
+    async def send(self, content=None, *, file=None, embed=None, **kwargs):
+        await api.call('send')
+        attachments = [FakeAttachment(file.filename)] if file is not None else []
+        message = FakeMessage(content, bot, self, attachments=attachments)
+        self.sent.append(message)
+        self._remember(message)
+        return message
+
+    async def fetch_message(self, id):
+        await api.call('fetch_message')
+        message = self.messages.get(id)
+        if message is None:
+            raise FakeHTTPException(404)
+        return message
+
+    def get_partial_message(self, id):
+        return FakePartialMessage(self, id)
+
+    async def delete_messages(self, messages):
+        await api.call('bulk_delete' if len(messages) > 1 else 'delete')
+        for message in messages:
+            self.messages.pop(message.id, None)
+
+    async def history(self, limit=100, before=None, after=None):
+        # newest first like discord.py, oldest first when `after` is given
+        messages = [m for m in self.messages.values()
+                    if (before is None or m.id < before.id) and (after is None or m.id > after.id)]
+        if after is None:
+            messages.reverse()
+        for start in range(0, len(messages) if limit is None else min(limit, len(messages)), 100):
+            await api.call('history')
+            for message in messages[start:start + 100][:None if limit is None else limit - start]:
+                yield message
+
+    def __eq__(self, other):
+        return isinstance(other, FakeChannel) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeGuild:
+    def __init__(self, id, members=()):
+        self.id = id
+        self.members = list(members)
+        for member in self.members:
+            member.guild = self
+
+class FakeClient:
+    def __init__(self, channels=(), guilds=()):
+        self.user = bot
+        self.channels = {c.id: c for c in channels}
+        self.guilds = {g.id: g for g in guilds}
+        self.presence = None
+        self.ready = True
+
+    def is_ready(self):
+        return self.ready
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+    def get_guild(self, id):
+        return self.guilds.get(id)
+
+    async def change_presence(self, activity=None, **kwargs):
+        await api.call('change_presence')
+        self.presence = activity
+
+    async def fetch_user(self, id):
+        await api.call('fetch_user')
+        return FakeUser(id, f'user{id}')
+
+bot = FakeUser(1, 'MilkyBot')
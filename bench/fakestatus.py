@@ -0,0 +1,49 @@
+# a local stand-in for api.mcsrvstat.us, answers /2/<address> in the same shape
+import asyncio, random
+from aiohttp import web
+
+class FakeStatusApi:
+    def __init__(self, players=(), mods=(), latency=0.0, online=True):
+        self.players = list(players)
+        self.mods = list(mods)
+        self.latency = latency
+        self.online = online
+        self.requests = 0
+        self._runner = None
+        self.port = None
+
+    def churn(self, pool, joins=1, leaves=1):
+        # a few players come and go between polls
+        for p in random.sample(self.players, min(leaves, len(self.players))):
+            self.players.remove(p)
+        waiting = [p for p in pool if p not in self.players]
+        self.players += random.sample(waiting, min(joins, len(waiting)))
+
+    async def _status(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if not self.online:
+            return web.json_response({'online': False})
+        return web.json_response({
+            'online': True,
+            'players': {'online': len(self.players), 'max': 50, 'list': list(self.players)},
+            'mods': {'names': list(self.mods)},
+        })
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_get('/2/{address}', self._status)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}/2/{{address}}'
+
+    async def stop(self):
+        await self._runner.cleanup()
@@ -0,0 +1,267 @@
+# replays a message stream through main.on_message while the status loop polls a fake api,
+# all against the fakes in bench/fakes.py, and reports how long everything took.
+#
+#   python bench/replay.py --synthetic 5000 --rate 500
+#   python bench/replay.py --messages bench/messages.jsonl --members 5000 --json run.json
+#   python bench/replay.py --synthetic 5000 --baseline run.json   # exits 1 on a regression
+#
+# message files are jsonl: {"content": "...", "author": 123, "channel": 456, "at": 1.5}
+# author/channel/at are optional, "at" is seconds from the start (otherwise --rate decides)
+import argparse, asyncio, collections, json, os, random, sys, tempfile, time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path.insert(0, root)
+sys.path.insert(0, here)
+os.environ.setdefault('TOKEN', 'replay')
+os.environ.setdefault('cognome', 'cognomesegreto')
+
+import fakes
+from fakes import FakeChannel, FakeClient, FakeGuild, FakeUser, FakeMessage
+from fakestatus import FakeStatusApi
+
+botChannel = 973943985552908328
+joinChannel = 1047182602005651628
+generalChannel = 2
+guildId = 954125943495065661
+interested = [954349361154900049, 973177697461239828, 991732194483654677]
+skipped = ('?restart', '?nosummon') # one execs the process, the other sleeps for 10 minutes
+
+synthetic = [
+    (30, 'hello everyone'), (20, 'anyone on the server tonight?'), (10, 'lol'), (10, 'gg'),
+    (8, 'i think the creeper blew up the farm again and now the whole base is flooded'),
+    (5, '?status'), (3, '?modding'), (3, '?help'), (2, '?sus'), (2, '?har'), (2, '?piston'),
+    (4, 'rip my base'), (3, 'wowza that is cool'), (2, '?c hello there'), (2, '?boycottkermit'),
+    (2, '?kermit'), (1, 'kermit i summon you'), (1, '?top'), (1, '?history player3'),
+]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def loadMessages(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def syntheticMessages(n, authors, seed):
+    rng = random.Random(seed)
+    weights = [w for w, _ in synthetic]
+    texts = [t for _, t in synthetic]
+    return [{'content': rng.choices(texts, weights)[0], 'author': rng.choice(authors).id,
+             'channel': rng.choice([botChannel, botChannel, generalChannel])} for _ in range(n)]
+
+class LoopLag:
+    # how late a 10ms sleep wakes up, i.e. how long something else held the loop
+    def __init__(self, every=0.01):
+        self.every = every
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.every)
+            self.samples.append(max(0.0, loop.time() - start - self.every))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+async def run(args):
+    os.chdir(root) # the bot opens its images relative to the repo
+    import main
+    from status import StatusService, ApiBackend
+    from history import SessionLog
+
+    tmp = tempfile.mkdtemp(prefix='milkybench-')
+    rng = random.Random(args.seed)
+    fakes.api.latency = args.latency / 1000
+    fakes.api.jitter = args.jitter / 1000
+    fakes.api.rateLimitRate = args.rate_limits
+    fakes.api.errorRate = args.errors
+
+    owners = [FakeUser(790909302566813717, 'owner'), FakeUser(525288877771063298, 'kermit')]
+    members = owners + [FakeUser(10 + i, f'player{i}', roles=[rng.choice(interested)] if rng.random() < 0.3 else [])
+                        for i in range(args.members)]
+    guild = FakeGuild(guildId, members)
+    channels = {c: FakeChannel(c, guild) for c in (botChannel, joinChannel, generalChannel)}
+    main.client = FakeClient(channels.values(), [guild])
+    main.roleIndex.path = os.path.join(tmp, 'users.json')
+    main.stateFile.path = os.path.join(tmp, 'state.json')
+    main.sessionLog = SessionLog(os.path.join(tmp, 'sessions.db'))
+
+    pool = [f'player{i}' for i in range(max(args.players * 2, 1))]
+    statusApi = await FakeStatusApi(pool[:args.players], mods=['create', 'jei']).start()
+    main.servers = ['fake.milkyway']
+    main.statusService = StatusService(main.servers, [ApiBackend(statusApi.url)], interval=args.poll_interval)
+    main.statusService.listeners.append(main.onStatus)
+    polls = []
+    fetch = main.statusService.fetch
+
+    async def timedFetch(server):
+        start = time.perf_counter()
+        try:
+            return await fetch(server)
+        finally:
+            polls.append(time.perf_counter() - start)
+    main.statusService.fetch = timedFetch
+
+    lag = LoopLag()
+    lag.start()
+
+    start = time.perf_counter()
+    await main.on_ready() # role scan + starts the poller
+    roleScan = time.perf_counter() - start
+
+    memberUpdates = []
+    for _ in range(args.member_updates):
+        member = rng.choice(members)
+        before = FakeUser(member.id, member.name, roles=[r.id for r in member.roles])
+        before.guild = guild
+        member.roles = [fakes.FakeRole(rng.choice(interested))] if not member.roles else []
+        t = time.perf_counter()
+        await main.on_member_update(before, member)
+        memberUpdates.append(time.perf_counter() - t)
+
+    async def churn():
+        while True:
+            await asyncio.sleep(args.poll_interval)
+            statusApi.churn(pool, args.churn, args.churn)
+    churner = asyncio.ensure_future(churn()) if args.churn else None
+
+    if args.messages:
+        messages = loadMessages(args.messages)
+    else:
+        messages = syntheticMessages(args.synthetic, owners + members[2:50], args.seed)
+    users = {m.id: m for m in members}
+
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+
+    async def handle(entry):
+        content = entry['content']
+        if content.startswith(skipped):
+            errors['skipped'] += 1
+            return
+        author = users.get(entry.get('author')) or FakeUser(entry.get('author', 3), f"user{entry.get('author', 3)}")
+        channel = channels.get(entry.get('channel', botChannel)) or channels[generalChannel]
+        message = FakeMessage(content, author, channel)
+        channel._remember(message)
+        parts = content.split(None, 1)
+        key = parts[0] if parts and parts[0] in main.router.commands else 'message'
+        t = time.perf_counter()
+        try:
+            await main.on_message(message)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies[key].append(time.perf_counter() - t)
+
+    replayStart = time.perf_counter()
+    tasks = []
+    for i, entry in enumerate(messages):
+        at = entry.get('at', i / args.rate if args.rate else None)
+        if at is None:
+            await handle(entry) # as fast as possible, one after the other
+            continue
+        delay = at - (time.perf_counter() - replayStart)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(handle(entry)))
+    await asyncio.gather(*tasks)
+    replayTime = time.perf_counter() - replayStart
+
+    if args.drain:
+        await asyncio.sleep(args.drain)
+    if churner is not None:
+        churner.cancel()
+    lag.stop()
+    await main.statusService.stop()
+    await statusApi.stop()
+    pending = sum(len(q) for q in main.outbox._queues.values())
+
+    allLatencies = [v for values in latencies.values() for v in values]
+    return {
+        'messages': len(allLatencies),
+        'seconds': replayTime,
+        'throughput': len(allLatencies) / replayTime if replayTime else 0.0,
+        'commands': {key: {'count': len(values), 'p50': percentile(values, 50), 'p90': percentile(values, 90),
+                           'p99': percentile(values, 99), 'max': max(values)} for key, values in sorted(latencies.items())},
+        'loopLag': {'p50': percentile(lag.samples, 50), 'p99': percentile(lag.samples, 99), 'max': max(lag.samples, default=0.0)},
+        'roleScan': roleScan,
+        'memberUpdate': {'count': len(memberUpdates), 'p50': percentile(memberUpdates, 50), 'p99': percentile(memberUpdates, 99)},
+        'statusPolls': {'count': len(polls), 'p50': percentile(polls, 50), 'p99': percentile(polls, 99), 'apiRequests': statusApi.requests},
+        'outbound': dict(fakes.calls),
+        'outboxPending': pending,
+        'errors': dict(errors),
+    }
+
+def ms(seconds):
+    return f'{seconds * 1000:8.3f}'
+
+def report(result):
+    print(f"{result['messages']} messages in {result['seconds']:.2f}s, {result['throughput']:.0f} msg/s")
+    print(f"{'command':<16}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for key, c in result['commands'].items():
+        print(f"{key:<16}{c['count']:>7}  {ms(c['p50'])}  {ms(c['p90'])}  {ms(c['p99'])}  {ms(c['max'])}")
+    lag = result['loopLag']
+    print(f"event loop lag  p50 {ms(lag['p50'])}  p99 {ms(lag['p99'])}  max {ms(lag['max'])} ms")
+    print(f"role scan       {ms(result['roleScan'])} ms, member update p99 {ms(result['memberUpdate']['p99'])} ms")
+    polls = result['statusPolls']
+    print(f"status polls    {polls['count']} (p50 {ms(polls['p50'])} ms, p99 {ms(polls['p99'])} ms), {polls['apiRequests']} api requests")
+    print('outbound calls  ' + ', '.join(f'{k}={v}' for k, v in sorted(result['outbound'].items())) + f", still queued={result['outboxPending']}")
+    if result['errors']:
+        print('errors          ' + ', '.join(f'{k}={v}' for k, v in sorted(result['errors'].items())))
+
+def compare(result, baseline, tolerance):
+    # p99s and throughput against a saved run, anything more than `tolerance` worse is a regression
+    regressions = []
+    for key, c in result['commands'].items():
+        old = baseline['commands'].get(key)
+        if old and old['p99'] and c['p99'] > old['p99'] * (1 + tolerance):
+            regressions.append(f"{key} p99 {ms(old['p99']).strip()} -> {ms(c['p99']).strip()} ms")
+    if baseline['loopLag']['p99'] and result['loopLag']['p99'] > baseline['loopLag']['p99'] * (1 + tolerance):
+        regressions.append('event loop lag p99')
+    if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput']:.0f} -> {result['throughput']:.0f} msg/s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', help='jsonl file to replay')
+    parser.add_argument('--synthetic', type=int, default=2000, help='number of generated messages when no file is given')
+    parser.add_argument('--rate', type=float, default=0, help='messages per second, 0 = back to back')
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--member-updates', type=int, default=200)
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--churn', type=int, default=1, help='players joining and leaving per poll')
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0, help='ms added to every fake discord call')
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--rate-limits', type=float, default=0, help='fraction of calls answered with a 429')
+    parser.add_argument('--errors', type=float, default=0, help='fraction of calls that fail with a 500')
+    parser.add_argument('--drain', type=float, default=0, help='seconds to let queued sends finish')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results here')
+    parser.add_argument('--baseline', help='results from an earlier --json run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    result = asyncio.get_event_loop().run_until_complete(run(args))
+    report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for r in regressions:
+            print('REGRESSION ' + r)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# micro-benchmark: on_message's old if-chain vs the Router
+# run with `python bench/router_bench.py [--extra N]`, no discord needed
+import argparse, os, random, sys, time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from router import Router, inChannel, byUsers, allOf
+
+botChannel = 973943985552908328
+emojilist = ['🇰', '🇪', '🇷', '🇲', '🇮', '🇹']
+permlist = [715057265048289282, 790909302566813717, 548863702334439434, 713656894891491328, 525288877771063298]
+cognome = 'cognomesegreto'
+
+def getChannel(channelId):
+    # stand-in for client.get_channel, the old code called it on every message
+    return channels.get(channelId)
+
+channels = {botChannel: SimpleNamespace(id=botChannel), 1: SimpleNamespace(id=1)}
+
+def oldChain(message, extra):
+    # the conditions from the old on_message, in the same order, without the side effects
+    hits = []
+    content = message.content
+    if cognome in content.lower():
+        hits.append('cognome')
+    if message.channel == getChannel(botChannel):
+        if content.startswith('?statsus') or content.startswith('?sus'):
+            hits.append('sus')
+        if content.startswith('?kermit'):
+            hits.append('kermit')
+        if '🇰' in content and '🇪' in content and '🇷' in content and '🇲' in content and '🇮' in content and '🇹' in content and message.author.id == 525288877771063298:
+            hits.append('kermitReact')
+        for name in ('?modding', '?har', '?platy', '?help'):
+            if content.startswith(name):
+                hits.append(name)
+        if content.startswith('?alph') and message.author.id == 790909302566813717:
+            hits.append('alph')
+        if content.startswith('?piston'):
+            hits.append('piston')
+    if content.startswith('?status'):
+        hits.append('status')
+    if content.startswith('?c '):
+        hits.append('c')
+    if 'wowza' in content:
+        hits.append('wowza')
+    for word in content.lower().split(" "):
+        if word == "rip":
+            hits.append('rip')
+    if content.startswith('?nosummon') and (message.author.id == 790909302566813717 or message.author.id == 525288877771063298):
+        hits.append('nosummon')
+    if content.startswith('?summon') and (message.author.id == 790909302566813717 or message.author.id == 525288877771063298):
+        hits.append('summon')
+    if message.author.id in permlist and 'kermit i summon you' in content.lower():
+        hits.append('summonKermit')
+    if message.author.id in permlist and 'pouffy i summon you' in content.lower():
+        hits.append('summonPouffy')
+    if content.startswith('?boycottkermit'):
+        hits.append('boycott')
+    if str(message.author) == 'DaniLucky#6874' and content.startswith('?blank'):
+        hits.append('blank')
+    if str(message.author) == 'DaniLucky#6874' and content.startswith('?restart'):
+        hits.append('restart')
+    if content.startswith('?del ') and message.author.id == 790909302566813717:
+        hits.append('del')
+    # what adding more commands / triggers costs the if-chain
+    for i in range(extra):
+        if content.startswith(f'?extra{i}'):
+            hits.append(i)
+        if f'extratrigger{i}' in content.lower():
+            hits.append(i)
+    return hits
+
+def buildRouter(extra):
+    router = Router()
+    noop = lambda *a: None
+    inBot = inChannel(botChannel)
+    owners = byUsers(790909302566813717, 525288877771063298)
+    isDani = lambda message: str(message.author) == 'DaniLucky#6874'
+    router.trigger(cognome)(noop)
+    router.command('?statsus', '?sus', '?kermit', '?modding', '?har', '?platy', '?help', '?piston', check=inBot)(noop)
+    router.trigger('🇰', check=allOf(inBot, byUsers(525288877771063298), lambda m: all(e in m.content for e in emojilist)))(noop)
+    router.command('?alph', check=allOf(inBot, byUsers(790909302566813717)))(noop)
+    router.command('?status', '?c', '?boycottkermit')(noop)
+    router.trigger('wowza')(lambda m: None)
+    router.trigger('rip', word=True)(lambda m: None)
+    router.command('?nosummon', '?summon', check=owners)(noop)
+    router.trigger('kermit i summon you', check=byUsers(*permlist))(lambda m: None)
+    router.trigger('pouffy i summon you', check=byUsers(*permlist))(lambda m: None)
+    router.command('?blank', '?restart', check=isDani)(noop)
+    router.command('?del', check=byUsers(790909302566813717))(noop)
+    for i in range(extra):
+        router.command(f'?extra{i}')(noop)
+        router.trigger(f'extratrigger{i}')(lambda m: None)
+    return router
+
+class Author(SimpleNamespace):
+    def __str__(self):
+        return self.name
+
+def corpus(n, seed=1):
+    rng = random.Random(seed)
+    texts = [
+        'hello everyone', 'anyone on the server tonight?', '?status', '?sus', '?help', 'rip my base',
+        'wowza that is cool', 'kermit i summon you', '?c hello there', 'lol', 'gg',
+        'this is a much longer message that just talks about nothing in particular for a while ' * 3,
+        '🇰 🇪 🇷 🇲 🇮 🇹', '?boycottkermit', 'i think the creeper blew up the farm again',
+    ]
+    authors = [Author(id=i, name=f'user{i}#0001') for i in (1, 2, 525288877771063298, 790909302566813717)]
+    return [SimpleNamespace(content=rng.choice(texts), author=rng.choice(authors), channel=channels[rng.choice([botChannel, 1])]) for _ in range(n)]
+
+def timeit(fn, messages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            fn(message)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(messages) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--extra', type=int, nargs='*', default=[0, 50, 200])
+    args = parser.parse_args()
+
+    messages = corpus(args.messages)
+    print(f'{"extra":>6} {"if-chain us/msg":>16} {"router us/msg":>14} {"speedup":>8}')
+    for extra in args.extra:
+        router = buildRouter(extra)
+        old = timeit(lambda m: oldChain(m, extra), messages, args.repeat)
+        new = timeit(router.resolve, messages, args.repeat)
+        print(f'{extra:>6} {old:>16.2f} {new:>14.2f} {old / new:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
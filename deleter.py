@@ -0,0 +1,84 @@
+import asyncio, time
+import discord
+
+# moderation deletes. ids are deleted straight away without fetching the messages first,
+# everything asked for in the same short window is batched per channel, and whatever is young
+# enough goes through the bulk endpoint (up to 100 per call) instead of one call per message
+
+discordEpoch = 1420070400000
+bulkMaxAge = 14 * 24 * 3600 - 60 # discord refuses bulk deletes of anything older than 14 days
+bulkSize = 100
+
+def snowflakeTime(id):
+    return ((id >> 22) + discordEpoch) / 1000
+
+class Deleter:
+    def __init__(self, window=0.3, concurrency=4):
+        self.window = window
+        self.concurrency = concurrency # single deletes running at once for old messages
+        self._batches = {} # channel id -> (channel, ids, future)
+        self.listeners = [] # called with the ids of every batch once it's been deleted
+
+    def delete(self, channel, ids):
+        # queue ids for deletion, returns a future with how many actually got deleted
+        # once the batch they ended up in has gone through
+        batch = self._batches.get(channel.id)
+        if batch is None:
+            future = asyncio.get_event_loop().create_future()
+            batch = self._batches[channel.id] = (channel, set(), future)
+            asyncio.ensure_future(self._flushLater(channel.id))
+        batch[1].update(ids)
+        return batch[2]
+
+    async def _flushLater(self, channelId):
+        await asyncio.sleep(self.window)
+        channel, ids, future = self._batches.pop(channelId)
+        try:
+            deleted = await self.deleteNow(channel, ids)
+        except Exception as e:
+            print(f'Deleting {len(ids)} messages in {channelId} failed: {e!r}')
+            deleted = 0
+        for listener in list(self.listeners):
+            listener(ids)
+        future.set_result(deleted)
+
+    async def deleteNow(self, channel, ids):
+        cutoff = time.time() - bulkMaxAge
+        young = sorted(i for i in ids if snowflakeTime(i) > cutoff)
+        old = [i for i in ids if snowflakeTime(i) <= cutoff]
+        deleted = 0
+        for start in range(0, len(young), bulkSize):
+            chunk = young[start:start + bulkSize]
+            if len(chunk) == 1:
+                old += chunk # the bulk endpoint wants at least 2
+                continue
+            try:
+                await channel.delete_messages([discord.Object(id=i) for i in chunk])
+                deleted += len(chunk)
+            except Exception:
+                old += chunk # one of them is gone or too old after all, do them one by one
+        return deleted + await self._single(channel, old)
+
+    async def _single(self, channel, ids):
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(i):
+            async with limit:
+                try:
+                    await channel.get_partial_message(i).delete()
+                    return 1
+                except Exception as e:
+                    if getattr(e, 'status', None) != 404: # already gone is fine
+                        print(f'Deleting message {i} failed: {e!r}')
+                    return 0
+
+        return sum(await asyncio.gather(*(one(i) for i in ids)))
+
+    async def purge(self, channel, limit, before=None, after=None, check=None):
+        # looks through up to `limit` messages and queues the ones that pass `check`,
+        # returns the same future as delete()
+        ids = []
+        async for message in channel.history(limit=limit, before=before, after=after):
+            if check is None or check(message):
+                ids.append(message.id)
+        return self.delete(channel, ids)
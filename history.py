@@ -0,0 +1,147 @@
+import asyncio, collections, sqlite3, time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# every play session on the server, one row per join with the time they left filled in later.
+# sqlite does the work on its own thread, charts get drawn in a separate process
+
+schema = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    player TEXT NOT NULL COLLATE NOCASE,
+    started REAL NOT NULL,
+    ended REAL
+);
+CREATE INDEX IF NOT EXISTS sessionsPlayer ON sessions (player, started);
+CREATE INDEX IF NOT EXISTS sessionsEnded ON sessions (ended);
+CREATE INDEX IF NOT EXISTS sessionsOpen ON sessions (player) WHERE ended IS NULL;
+'''
+
+day = 24 * 3600
+
+def formatDuration(seconds):
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f'{minutes}m'
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f'{hours}h {minutes}m'
+    days, hours = divmod(hours, 24)
+    return f'{days}d {hours}h'
+
+def dailyPlaytime(rows, since, now):
+    # splits sessions over day buckets, returns hours played per day
+    buckets = [0.0] * max(1, int((now - since) // day) + 1)
+    for started, ended in rows:
+        start = max(started, since)
+        end = min(ended if ended is not None else now, now)
+        while start < end:
+            i = int((start - since) // day)
+            edge = min(end, since + (i + 1) * day)
+            buckets[i] += (edge - start) / 3600
+            start = edge
+    return buckets
+
+def renderActivity(hours, since, title):
+    # runs in the chart process, matplotlib only ever gets imported there
+    import io, datetime
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    days = [datetime.date.fromtimestamp(since + i * day) for i in range(len(hours))]
+    fig, ax = plt.subplots(figsize=(8, 3.5), dpi=100)
+    ax.bar(days, hours, color='#03a9f4')
+    ax.set_title(title)
+    ax.set_ylabel('hours played')
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    out = io.BytesIO()
+    fig.savefig(out, format='png')
+    plt.close(fig)
+    return out.getvalue()
+
+class SessionLog:
+    def __init__(self, path='./data/sessions.db', cacheSize=32, openTtl=300):
+        self.path = path
+        self.generation = 0 # bumped on every change, part of the chart cache key
+        self._db = None
+        self._io = ThreadPoolExecutor(max_workers=1)
+        self._charts = None
+        self._cache = collections.OrderedDict()
+        self.cacheSize = cacheSize
+        self.openTtl = openTtl # how long a chart with someone still online stays cached
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._io, fn, *args)
+
+    def _conn(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(schema)
+        return self._db
+
+    def _sync(self, players, when):
+        db = self._conn()
+        online = set(players)
+        open_ = {row[0] for row in db.execute('SELECT player FROM sessions WHERE ended IS NULL')}
+        left = open_ - online
+        joined = online - open_
+        with db:
+            db.executemany('UPDATE sessions SET ended = ? WHERE player = ? AND ended IS NULL', [(when, p) for p in left])
+            db.executemany('INSERT INTO sessions (player, started) VALUES (?, ?)', [(p, when) for p in joined])
+        return bool(left or joined)
+
+    async def sync(self, players, when=None):
+        # makes the open sessions match who's online right now, so it's fine to call
+        # after a restart too: whoever is still online keeps their session going
+        changed = await self._run(self._sync, list(players), when or time.time())
+        if changed:
+            self.generation += 1
+        return changed
+
+    def _history(self, player, limit):
+        db = self._conn()
+        rows = db.execute('SELECT player, started, ended FROM sessions WHERE player = ? ORDER BY started DESC LIMIT ?', (player, limit)).fetchall()
+        total, count = db.execute('SELECT SUM(COALESCE(ended, ?) - started), COUNT(*) FROM sessions WHERE player = ?', (time.time(), player)).fetchone()
+        return rows, total or 0, count
+
+    async def history(self, player, limit=10):
+        return await self._run(self._history, player, limit)
+
+    def _top(self, since, limit):
+        now = time.time()
+        return self._conn().execute('''
+            SELECT player, SUM(MIN(COALESCE(ended, :now), :now) - MAX(started, :since)) AS played
+            FROM sessions WHERE ended IS NULL OR ended > :since
+            GROUP BY player ORDER BY played DESC LIMIT :limit
+        ''', {'now': now, 'since': since, 'limit': limit}).fetchall()
+
+    async def top(self, since, limit=10):
+        return await self._run(self._top, since, limit)
+
+    def _sessionsSince(self, since):
+        return self._conn().execute('SELECT started, ended FROM sessions WHERE ended IS NULL OR ended > ?', (since,)).fetchall()
+
+    async def activityChart(self, days):
+        # png of hours played per day over the last `days` days, cached until the log changes
+        # or the day rolls over. open sessions keep adding hours, so while anyone is online
+        # the chart only lives for openTtl seconds
+        now = time.time()
+        key = ('activity', days, self.generation, int(now // day))
+        cached = self._cache.get(key)
+        if cached is not None and (cached[1] is None or now < cached[1]):
+            self._cache.move_to_end(key)
+            return cached[0]
+        since = now - days * day
+        rows = await self._run(self._sessionsSince, since)
+        hours = dailyPlaytime(rows, since, now)
+        expires = now + self.openTtl if any(ended is None for _, ended in rows) else None
+        if self._charts is None:
+            self._charts = ProcessPoolExecutor(max_workers=1)
+        png = await asyncio.get_event_loop().run_in_executor(self._charts, renderActivity, hours, since, f'Milkyway activity, last {days} days')
+        self._cache[key] = (png, expires)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cacheSize:
+            self._cache.popitem(last=False)
+        return png
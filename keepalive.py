@@ -1,16 +1,97 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, Response
 from threading import Thread
-import json
+import json, gzip, hashlib, os
+import metrics
 app = Flask(__name__)
 
+# the user list lives in memory, already serialized and gzipped. publishUsers swaps
+# the whole tuple in one assignment so a request never sees half an update
+_snapshot = None
+
+def _build(userList):
+  body = json.dumps({"users": userList}, separators=(',', ':')).encode()
+  etag = hashlib.sha1(body).hexdigest()
+  return (userList, body, gzip.compress(body, 6), etag)
+
+def publishUsers(userList):
+  global _snapshot
+  _snapshot = _build(list(userList))
+
+def loadUsers(path="./data/users.json"):
+  try:
+    with open(path, "r") as f:
+      publishUsers(json.load(f)["users"])
+  except (OSError, ValueError, KeyError):
+    publishUsers([])
+
+def _respond(body, gzipped, etag):
+  if request.if_none_match.contains(etag):
+    return Response(status=304, headers={"ETag": '"' + etag + '"'})
+  headers = {"ETag": '"' + etag + '"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+  if gzipped is not None and "gzip" in request.accept_encodings:
+    headers["Content-Encoding"] = "gzip"
+    body = gzipped
+  return Response(body, mimetype="application/json", headers=headers)
+
+def _intArg(name, default):
+  try:
+    return max(0, int(request.args.get(name, default)))
+  except ValueError:
+    return default
+
 @app.route('/get-user-info', methods=['GET'])
 def home():
-  f = open("./data/users.json", "r").read()
-  print(f)
-  return jsonify(json.loads(f))
+  userList, body, gzipped, etag = _snapshot
+  fields = request.args.get("fields")
+  if fields is None and "offset" not in request.args and "limit" not in request.args:
+    return _respond(body, gzipped, etag)
+
+  # projected / paginated views are built from the in-memory list, never from disk
+  users = userList
+  offset = _intArg("offset", 0)
+  limit = _intArg("limit", len(users))
+  page = users[offset:offset + limit]
+  if fields is not None:
+    wanted = [f for f in fields.split(",") if f]
+    page = [{k: u[k] for k in wanted if k in u} for u in page]
+  body = json.dumps({"users": page, "total": len(users), "offset": offset}, separators=(',', ':')).encode()
+  # depends on the snapshot and the query, so it still changes whenever the list does
+  tag = hashlib.sha1(etag.encode() + request.query_string).hexdigest()
+  return _respond(body, gzip.compress(body, 6) if len(body) > 1024 else None, tag)
+
+@app.route('/metrics', methods=['GET'])
+def metricsPage():
+  return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# sampling profiler for the bot's event loop, switched on and off at runtime.
+# only there when PROFILE_TOKEN is set, and every call has to pass it as ?token=
+@app.route('/debug/profile', methods=['GET', 'POST'])
+def profile():
+  token = os.environ.get("PROFILE_TOKEN")
+  if not token or request.args.get("token") != token:
+    return Response(status=404)
+  action = request.args.get("action")
+  if action == "start":
+    metrics.profiler.start(interval=_intArg("interval", 5) / 1000 or None)
+  elif action == "stop":
+    metrics.profiler.stop()
+  elif action == "reset":
+    metrics.profiler.reset()
+  return Response(metrics.profiler.report(_intArg("top", 30)), mimetype="text/plain")
+
 def run():
-  app.run(host='0.0.0.0',port=8080)
+  try:
+    from waitress import serve
+  except ImportError:
+    serve = None
+  if serve is not None:
+    serve(app, host='0.0.0.0', port=8080, threads=8)
+  else:
+    from werkzeug.serving import make_server
+    make_server('0.0.0.0', 8080, app, threaded=True).serve_forever()
 
 def keep_alive():
+    if _snapshot is None:
+      loadUsers()
     t = Thread(target=run)
-    t.start()
\ No newline at end of file
+    t.start()
@@ -1,16 +1,40 @@
-import discord, os, sys, asyncio, requests, random, traceback, json
-from keepalive import keep_alive
-
-#from mcstatus import JavaServer
+import time
+bootTime = time.time() # to see how long it takes to get to on_ready
+import discord, os, sys, asyncio, random, traceback, io, datetime, re
+from keepalive import keep_alive, publishUsers
+from status import StatusService, StatusSnapshot, NativeBackend, ApiBackend
+from roles import RoleIndex
+from router import Router, inChannel, byUsers, allOf
+from assets import AssetCache
+from outbox import Outbox
+from deleter import Deleter
+from history import SessionLog, formatDuration
+import metrics
+from metrics import timedEvent
+from state import StateFile
 
 ip = '81.16.61.58'
-url = f'https://api.mcsrvstat.us/2/{ip}'
+apiUrl = 'https://api.mcsrvstat.us/2/{address}'
+servers = [s.strip() for s in os.environ.get('MC_SERVERS', ip).split(',') if s.strip()] # the first one is the main server
+# ask the servers directly, the http api is only there for when that doesn't work
+statusService = StatusService(servers, [NativeBackend(), ApiBackend(apiUrl)])
+roleIndex = RoleIndex("./data/users.json")
+roleIndex.listeners.append(publishUsers) # keepalive serves the list from memory
+outbox = Outbox()
+deleter = Deleter()
+purgeScan = 200 # how far back ?del author/pattern look
+purgeMax = 1000
+metrics.watchRateLimits()
+sessionLog = SessionLog('./data/sessions.db')
 emojilist = ['🇰', '🇪', '🇷', '🇲', '🇮', '🇹']
 TOKEN = os.environ["TOKEN"]
 apiIP = "127.0.0.1"
 cognome = os.environ['cognome']
 kermitping = True
-prevplayers = []
+nosummonUntil = 0
+prevplayers = {} # server -> players online at the last poll
+presence = None
+sessionsBehind = False # the last session log sync failed
 praisephrases = [
     "Praise Kermit!", "God's will is in Kermit's hand",
     "Your mistakes will have consequences",
@@ -20,281 +44,473 @@ praisephrases = [
 lastpraise = ""
 blankstring = "\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n\n"
 
-def filterString(_string):
-	_allowedChars = ["a","b","c","d","e","f","g","h","i","j","k","l","m","n","o","p","q","r","s","t","u","v","w","x","y","z","A","B","C","D","E","F","G","H","I","J","K","L","M","N","O","P","Q","R","S","T","U","V","W","X","Y","Z","1","2","3","4","5","6","7","8","9","0"," "]
-	_result = ""
-	for i in _string :
-		if i in _allowedChars:
-			_result += i
-	return _result
-
-#server = JavaServer.lookup(ip)
-#status = server.status()
-
 intents = discord.Intents.all()
 client = discord.Client(intents=intents) # I dont fucking know why i had to add the intents thing but eihg 
+metrics.watchRequests(client.http) # counts every call to the discord api for /metrics
+
+# what survives a restart, so nobody gets announced as joined again and ?nosummon keeps going
+stateFile = StateFile('./data/state.json')
+maxStateAge = 3600 # older than this and the player lists are more wrong than helpful (the file is rewritten every 5 minutes at least)
+restartRequested = False
+
+def snapshotState():
+    return {
+        'prevplayers': prevplayers,
+        'kermitping': kermitping,
+        'nosummonUntil': nosummonUntil,
+        'status': {server: snap.toDict() for server, snap in statusService.snapshots.items()},
+    }
+
+def saveState(force=False):
+    try:
+        stateFile.save(snapshotState(), force)
+    except OSError as e:
+        print(f'Could not save state: {e!r}')
+
+def restoreState():
+    global kermitping, nosummonUntil
+    roleIndex.load()
+    data = stateFile.load()
+    if not data:
+        return
+    remaining = data.get('nosummonUntil', 0) - time.time()
+    if not data.get('kermitping', True) and remaining > 0:
+        kermitping = False
+        nosummonUntil = data['nosummonUntil']
+        asyncio.ensure_future(resummon(remaining))
+    if time.time() - data.get('saved', 0) < maxStateAge:
+        prevplayers.update(data.get('prevplayers', {}))
+        for server, snap in data.get('status', {}).items():
+            if server in servers:
+                statusService.snapshots[server] = StatusSnapshot.fromDict(snap)
+
+async def resummon(delay):
+    global kermitping
+    await asyncio.sleep(delay)
+    if time.time() >= nosummonUntil:
+        kermitping = True
+
+async def saveStateLoop(every=30):
+    while True:
+        await asyncio.sleep(every)
+        saveState()
+
+stateSaver = None
 
 async def getUserById(username):
     user = await client.fetch_user(username)
     return user
 
-def parseInterestedRoles(_guild):
-    userList = []
-    usrListTmp = []
-    for i in _guild.members:
-        interestedRoles = [954349361154900049, 973177697461239828, 991732194483654677, 970767639691546755, 1046194175885971456, 1040337661581344909]
-        for j in i.roles:
-            if j.id in interestedRoles:
-                if i.name not in usrListTmp:
-                    usrListTmp.append(i.name)
-                    userList.append({
-                        "name": filterString(str(i.name)),
-                        "discriminator": str(i.discriminator),
-                        "id": filterString(str(i.id)),
-                        "avatar": str(i.avatar),
-                    })
-    print(usrListTmp)
-    _data ='{ "users": ' + json.dumps(userList) + '}'
-    open("./data/users.json","w").write(_data)
+async def onStatus(server, old, pars):
+    global presence, sessionsBehind
+    if not client.is_ready():
+        return # closed or reconnecting, prevplayers stays put so the diff catches up after READY
+    channel2 = client.get_channel(1047182602005651628)
+
+    if server == statusService.primary:
+        text = f'Milkyway, Online: {str(pars.online)}, {pars.count} players online'
+        if text != presence:
+            await client.change_presence(activity=discord.Game(text))
+            presence = text
+
+    if pars.partial:
+        return # only a sample of who's on, diffing it would announce made up joins and leaves
+
+    players = pars.players
+    before = prevplayers.get(server, [])
+    where = f' {server}' if len(servers) > 1 else ''
+
+    if before != players:
+        # lines queued in the same tick go out as a single diff block
+        for p in sorted(set(players) - set(before)):
+            outbox.send(channel2, f'+ {p} joined{where}!', merge='```diff\n{}\n```')
+        for p in sorted(set(before) - set(players)):
+            outbox.send(channel2, f'- {p} left{where}!', merge='```diff\n{}\n```')
+    prevplayers[server] = players # before the sync, a history failure mustn't repeat the announcements
+    if server == statusService.primary and (old is None or before != players or sessionsBehind):
+        try:
+            await sessionLog.sync(players, pars.fetched)
+            sessionsBehind = False
+        except Exception as e:
+            sessionsBehind = True # sync just matches the open sessions to who's online, so retry next poll
+            print(f'Could not update the session log: {e!r}')
+
+statusService.listeners.append(onStatus)
 
 @client.event
+@timedEvent
 async def on_ready():
-    global prevplayers
-    global milkyway
+    global milkyway, presence
+    presence = None # a fresh session starts without our activity, the next poll sends it again
     channel = client.get_channel(973943985552908328)
-    channel2 = client.get_channel(1047182602005651628)
     milkyway = client.get_guild(954125943495065661) # Milkyway server ID
-    print('Logged in')
+    global stateSaver
+    print(f'Logged in ({time.time() - bootTime:.1f}s after start)')
     try:
         onlineList = ['oogey boogey onliny booby']
         await channel.send(onlineList[random.randint(0, len(onlineList)-1)])
     except:
         print("Error whilst sending message. Is the bot in the milkyway server with the right privilages? :P")
 
-    parseInterestedRoles(milkyway) # This function gets the interested roles and writes them to ./data/user.json
+    roleIndex.build(milkyway) # scans the interested roles once, the member events below keep it up to date and write ./data/users.json
 
-    while True:
-        pars = requests.get(url, ).json()
+    statusService.start() # polls the servers in the background and calls onStatus with every fresh snapshot
+    metrics.watchLoopLag()
+    if stateSaver is None or stateSaver.done():
+        stateSaver = asyncio.ensure_future(saveStateLoop())
 
-        if pars['online'] == True:
-            online = pars['players']['online']
-        else:
-            online = 0
-
-        await client.change_presence(activity=discord.Game(
-            f'Milkyway, Online: {str(pars["online"])}, {online} players online'
-        ))
-
-        players = []
-        if online != 0:
-            players = list(pars['players']['list'])
-
-        if prevplayers != players:
-            if len(prevplayers) <= len(players):
-                joinedplayers = list(set(players) - set(prevplayers))
-                for p in joinedplayers:
-                    try:
-                        await channel2.send(f'```diff\n+ {p} joined!\n```')
-                    except:
-                        pass
-            elif len(prevplayers) >= len(players):
-                leftplayers = list(set(prevplayers) - set(players))
-                for p in leftplayers:
-                    try:
-                        await channel2.send(f'```diff\n- {p} left!\n```')
-                    except:
-                        pass
-        prevplayers = players
-
-        parseInterestedRoles(milkyway)
-
-        await asyncio.sleep(5)
+def isMilkyway(guild):
+    return guild is not None and guild.id == 954125943495065661
 
 @client.event
-async def on_message(message):
-    global kermitping
-    global lastpraise
-    a = 1
-    if message.author == client.user:
+@timedEvent
+async def on_member_join(member):
+    if isMilkyway(member.guild):
+        roleIndex.updateMember(member)
+
+@client.event
+@timedEvent
+async def on_member_update(before, after):
+    if isMilkyway(after.guild) and (before.roles != after.roles or before.name != after.name or before.avatar != after.avatar):
+        roleIndex.updateMember(after)
+
+@client.event
+@timedEvent
+async def on_member_remove(member):
+    if isMilkyway(member.guild):
+        roleIndex.removeMember(member)
+
+@client.event
+@timedEvent
+async def on_user_update(before, after):
+    roleIndex.updateUser(after)
+
+# raw so it fires for messages that aren't in the cache anymore, someone else deleting an
+# upload the asset cache still links to means it has to upload again
+@client.event
+async def on_raw_message_delete(payload):
+    assetCache.messagesDeleted([payload.message_id])
+
+@client.event
+async def on_raw_bulk_message_delete(payload):
+    assetCache.messagesDeleted(payload.message_ids)
+
+botChannel = 973943985552908328
+ownerIds = (790909302566813717, 525288877771063298)
+permlist = (
+    715057265048289282, 790909302566813717, 548863702334439434,
+    713656894891491328, 525288877771063298
+)
+regionalLetters = frozenset('abcdefghijklmnopqrstuvwxyz')
+router = Router()
+inBotChannel = inChannel(botChannel)
+isDani = lambda message: str(message.author) == 'DaniLucky#6874'
+
+# uploaded once, then reposted by link. a burst of the same one in a channel only sends once
+assetCache = AssetCache(debounce=3)
+assetCache.register('sus', 'amogus.png')
+assetCache.register('har', 'har.gif')
+assetCache.register('piston', 'piston.gif')
+assetCache.register('rip', 'rip-coffin.gif')
+deleter.listeners.append(assetCache.messagesDeleted)
+
+if cognome:
+    @router.trigger(cognome)
+    async def cognomeFilter(message):
+        deleter.delete(message.channel, [message.id])
+
+# bot channel commands
+@router.command('?statsus', '?sus', check=inBotChannel)
+async def sus(message, args):
+    await assetCache.send(message.channel, 'sus')
+
+@router.command('?kermit', check=inBotChannel)
+async def kermit(message, args):
+    msg = await message.channel.send(
+        ':regional_indicator_k: :regional_indicator_e: :regional_indicator_r: :regional_indicator_m: :regional_indicator_i: :regional_indicator_t:'
+    )
+    outbox.react(msg, emojilist)
+
+@router.trigger('🇰', check=allOf(inBotChannel, byUsers(525288877771063298), lambda message: all(emoji in message.content for emoji in emojilist)))
+async def kermitReact(message):
+    outbox.react(message, emojilist)
+
+@router.command('?modding', check=inBotChannel)
+async def modding(message, args):
+    pars = statusService.snapshot
+    modslist = ''
+    if pars is None:
+        await message.channel.send('No status yet, try again in a few seconds')
+    elif pars.online:
+        for mod in pars.mods:
+            modslist += mod + ', '
+        await message.channel.send('The mods are: ' + modslist +
+                                   '\n**Total: ' +
+                                   str(len(pars.mods)) +
+                                   '**')
+    else:
+        await message.channel.send('Server offline')
+
+@router.command('?har', check=inBotChannel)
+async def har(message, args):
+    await assetCache.send(message.channel, 'har')
+
+@router.command('?platy', check=inBotChannel)
+async def platy(message, args):
+    await message.channel.send('https://imgur.com/a/6rwwTZI')
+
+@router.command('?help', check=inBotChannel)
+async def helpCommand(message, args):
+    commlist = '?help, ?kermit, ?status, ?statsus, ?sus, ?c, ?modding, ?har, ?platy, ?boycottkermit, ?piston, ?history, ?top, ?activity'
+    embedHelp = discord.Embed(title='Help', color=0xf00000)
+    embedHelp.add_field(name='Commands availiable:', value=commlist)
+    await message.channel.send(embed=embedHelp)
+
+@router.command('?alph', check=allOf(inBotChannel, byUsers(790909302566813717)))
+async def alph(message, args):
+    letters = '🇦 🇧 🇨 🇩 🇪 🇫 🇬 🇭 🇮 🇯 🇰 🇱 🇲 🇳 🇴 🇵 🇶 🇷 🇸 🇹'
+    outbox.react(message, letters.split(' '))
+
+@router.command('?piston', check=inBotChannel)
+async def piston(message, args):
+    await assetCache.send(message.channel, 'piston')
+
+def parseDays(args, default=7):
+    try:
+        return min(max(int(args), 1), 365)
+    except ValueError:
+        return default
+
+@router.command('?history', check=inBotChannel)
+async def historyCommand(message, args):
+    if not args:
+        await message.channel.send('Usage: ?history <player>')
         return
+    rows, total, count = await sessionLog.history(args.strip())
+    if not rows:
+        await message.channel.send(f'Never seen {args.strip()} on the server')
+        return
+    lines = []
+    for player, started, ended in rows:
+        when = datetime.datetime.fromtimestamp(started).strftime('%d/%m %H:%M')
+        lines.append(f'{when} - ' + ('online now' if ended is None else formatDuration(ended - started)))
+    embedVar = discord.Embed(title=f'History for {rows[0][0]}', color=0x03a9f4)
+    embedVar.add_field(name='Total playtime', value=f'{formatDuration(total)} over {count} sessions', inline=False)
+    embedVar.add_field(name='Last sessions', value='\n'.join(lines), inline=False)
+    await message.channel.send(embed=embedVar)
+
+@router.command('?top', check=inBotChannel)
+async def topCommand(message, args):
+    days = parseDays(args)
+    rows = await sessionLog.top(time.time() - days * 86400)
+    if not rows:
+        await message.channel.send(f'Nobody played in the last {days} days')
+        return
+    lines = [f'**{i + 1}.** {player} - {formatDuration(played)}' for i, (player, played) in enumerate(rows)]
+    embedVar = discord.Embed(title=f'Top players, last {days} days', color=0x03a9f4, description='\n'.join(lines))
+    await message.channel.send(embed=embedVar)
 
-    if cognome in message.content.lower():
-        await asyncio.sleep(0.2)
-        await message.delete()
-    # bot channel commands
-    if message.channel == client.get_channel(973943985552908328):
-        if message.content.startswith(
-                '?statsus') or message.content.startswith('?sus'):
-            with open('amogus.png', 'rb') as img:
-                pic = discord.File(img)
-            await message.channel.send(file=pic)
-
-        if message.content.startswith('?kermit'):
-            msg = await message.channel.send(
-                ':regional_indicator_k: :regional_indicator_e: :regional_indicator_r: :regional_indicator_m: :regional_indicator_i: :regional_indicator_t:'
-            )
-            for emoji in emojilist:
-                await msg.add_reaction(emoji)
-
-        if '🇰' in message.content and '🇪' in message.content and '🇷' in message.content and '🇲' in message.content and '🇮' in message.content and '🇹' in message.content and message.author.id == 525288877771063298:
-            for emoji in emojilist:
-                await message.add_reaction(emoji)
-
-        if message.content.startswith('?modding'):
-            pars = requests.get(url).json()
-            modslist = ''
-            if pars['online']:
-                for mod in pars['mods']['names']:
-                    modslist += mod + ', '
-                await message.channel.send('The mods are: ' + modslist +
-                                           '\n**Total: ' +
-                                           str(len(pars['mods']['names'])) +
-                                           '**')
-            else:
-                await message.channel.send('Server offline')
-
-        if message.content.startswith('?har'):
-            with open('har.gif', 'rb') as ha:
-                har = discord.File(ha)
-                await message.channel.send(file=har)
-
-        if message.content.startswith('?platy'):
-            await message.channel.send('https://imgur.com/a/6rwwTZI')
-
-        if message.content.startswith('?help'):
-            commlist = '?help, ?kermit, ?status, ?statsus, ?sus, ?c, ?modding, ?har, ?platy, ?boycottkermit, ?piston'
-            embedHelp = discord.Embed(title='Help', color=0xf00000)
-            embedHelp.add_field(name='Commands availiable:', value=commlist)
-            await message.channel.send(embed=embedHelp)
-
-        if message.content.startswith(
-                '?alph') and message.author.id == 790909302566813717:
-            letters = '🇦 🇧 🇨 🇩 🇪 🇫 🇬 🇭 🇮 🇯 🇰 🇱 🇲 🇳 🇴 🇵 🇶 🇷 🇸 🇹'
-            for letter in letters:
-                if letter != ' ':
-                    await message.add_reaction(letter)
-
-        if message.content.startswith('?piston'):
-            with open('piston.gif', 'rb') as pis:
-                piston = discord.File(pis)
-                await message.channel.send(file=piston)
-    # all channels commands
-
-    if message.content.startswith('?status'):
-        pars = requests.get(url).json()
-        if pars['online'] == True:
-            online = pars['players']['online']
-        else:
-            online = 0
-        embedVar = discord.Embed(title='Server Status', color=0x03a9f4)
-        embedVar.add_field(name='Online', value=pars['online'])
-        embedVar.add_field(name='Players online:', value=online)
-        players = ''
-        if online != 0:
-            for player in pars['players']['list']:
-                players = players + player + ', '
-        else:
-            players = 'No players online!'
-        players = players.rstrip(', ')
-        if online != 1:
-            embedVar.add_field(name='Players:', value=players)
+@router.command('?activity', check=inBotChannel)
+async def activityCommand(message, args):
+    days = parseDays(args, 14)
+    try:
+        png = await sessionLog.activityChart(days)
+    except ImportError:
+        await message.channel.send('Charts need matplotlib installed')
+        return
+    await message.channel.send(file=discord.File(io.BytesIO(png), filename='activity.png'))
+
+# all channels commands
+@router.command('?status')
+async def statusCommand(message, args):
+    server = args.strip() or statusService.primary
+    if server not in servers:
+        await message.channel.send(f'Not watching {server}, try one of: ' + ', '.join(servers))
+        return
+    pars = statusService.snapshots.get(server)
+    if pars is None:
+        await message.channel.send('No status yet, try again in a few seconds')
+        return
+    online = pars.count
+    embedVar = discord.Embed(title='Server Status' + (f' - {server}' if len(servers) > 1 else ''), color=0x03a9f4)
+    embedVar.add_field(name='Online', value=pars.online)
+    embedVar.add_field(name='Players online:', value=online)
+    players = ''
+    if online != 0:
+        for player in pars.players:
+            players = players + player + ', '
+    else:
+        players = 'No players online!'
+    players = players.rstrip(', ')
+    if pars.partial:
+        players = (players + f' and {online - len(pars.players)} more').lstrip()
+    if online != 1:
+        embedVar.add_field(name='Players:', value=players)
+    else:
+        embedVar.add_field(name='Player:', value=players)
+    await message.channel.send(embed=embedVar)
+    if pars.online == False:
+        print('server offline')
+        #await message.channel.send('<@713656894891491328> the server is offline!')
+
+@router.command('?c')
+async def regional(message, args):
+    if not args:
+        return
+    towrite = ''
+    for letter in args:
+        if letter != ' ' and letter.lower() in regionalLetters:
+            towrite += ':regional_indicator_' + letter.lower() + ':'
+        elif letter == ' ':
+            towrite += '   '
         else:
-            embedVar.add_field(name='Player:', value=players)
-        await message.channel.send(embed=embedVar)
-        if pars['online'] == False:
-            print('server offline')
-            #await message.channel.send('<@713656894891491328> the server is offline!')
-
-    if message.content.startswith('?c '):
-        towrite = ''
-        msg = str(message.content).replace('?c ', '')
-        for letter in msg:
-            if letter != ' ' and letter.lower() in [
-                    'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l',
-                    'm', 'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x',
-                    'y', 'z'
-            ]:
-                towrite += ':regional_indicator_' + letter.lower() + ':'
-            elif letter == ' ':
-                towrite += '   '
-            else:
-                towrite += letter
-        await message.channel.send(towrite)
-        await message.delete()
-    if 'wowza' in message.content:
-        await message.channel.send('<:wowza:974932545152106606>')
-
-    for word in message.content.lower().split(" "):
-        if word == "rip":
-            with open('rip-coffin.gif', 'rb') as file:
-                gif = discord.File(file)
-            await message.channel.send(file=gif)
-    
-    if message.content.startswith('?nosummon') and (
-            message.author.id == 790909302566813717
-            or message.author.id == 525288877771063298):
-        kermitping = False
-        await message.channel.send('Not summoning you')
-        await asyncio.sleep(600)
-        kermitping = True
-
-    if message.content.startswith('?summon') and (
-            message.author.id == 790909302566813717
-            or message.author.id == 525288877771063298):
-        kermitping = True
-        await message.channel.send('I will summon you again!')
-
-    permlist = [
-        715057265048289282, 790909302566813717, 548863702334439434,
-        713656894891491328, 525288877771063298
-    ]
-    if message.author.id in permlist and 'kermit i summon you' in message.content.lower(
-    ) and kermitping:
+            towrite += letter
+    await message.channel.send(towrite)
+    await message.delete()
+
+@router.trigger('wowza', caseSensitive=True)
+async def wowza(message):
+    await message.channel.send('<:wowza:974932545152106606>')
+
+@router.trigger('rip', word=True)
+async def rip(message):
+    await assetCache.send(message.channel, 'rip', debounce=True) # a burst of rips only gets one coffin
+
+@router.command('?nosummon', check=byUsers(*ownerIds))
+async def nosummon(message, args):
+    global kermitping, nosummonUntil
+    kermitping = False
+    nosummonUntil = time.time() + 600
+    saveState()
+    await message.channel.send('Not summoning you')
+    await resummon(600)
+
+@router.command('?summon', check=byUsers(*ownerIds))
+async def summon(message, args):
+    global kermitping, nosummonUntil
+    kermitping = True
+    nosummonUntil = 0
+    await message.channel.send('I will summon you again!')
+
+@router.trigger('kermit i summon you', check=byUsers(*permlist))
+async def summonKermit(message):
+    if kermitping:
         for i in range(5):
-            await message.channel.send('<@525288877771063298>')
-    if message.author.id in permlist and 'pouffy i summon you' in message.content.lower(
-    ) and kermitping:
+            outbox.send(message.channel, '<@525288877771063298>')
+
+@router.trigger('pouffy i summon you', check=byUsers(*permlist))
+async def summonPouffy(message):
+    if kermitping:
         for i in range(5):
-            await message.channel.send('<@713656894891491328>')
-    if message.content.startswith('?boycottkermit'):
-        while a == 1:
-            chosenpraise = random.choice(praisephrases)
-            if chosenpraise != lastpraise:
-                lastpraise = chosenpraise
-                await message.channel.send(chosenpraise)
-                a = 0
-            else:
-                a = 1
-    if str(message.author) == 'DaniLucky#6874' and message.content.startswith(
-            '?blank'):
-        await message.channel.send(blankstring)
-    if str(message.author) == 'DaniLucky#6874' and message.content.startswith(
-            '?restart'):
-        await message.channel.send(f'Stopping, {message.author}')
+            outbox.send(message.channel, '<@713656894891491328>')
+
+@router.command('?boycottkermit')
+async def boycottkermit(message, args):
+    global lastpraise
+    chosenpraise = random.choice([p for p in praisephrases if p != lastpraise])
+    lastpraise = chosenpraise
+    await message.channel.send(chosenpraise)
+
+@router.command('?blank', check=isDani)
+async def blank(message, args):
+    await message.channel.send(blankstring)
+
+@router.command('?restart', check=isDani)
+async def restart(message, args):
+    # reconnects in place, `?restart full` starts a fresh interpreter to pick up code changes
+    global restartRequested
+    await message.channel.send(f'Stopping, {message.author}')
+    saveState(force=True)
+    if args.strip() == 'full':
         python = sys.executable
         os.execl(python, python, *sys.argv)
-
-    if message.content.startswith(
-            '?del ') and message.author.id == 790909302566813717:
-        if ', ' not in message.content:
-            msg = await message.channel.fetch_message(
-                int(message.content.replace('?del ', '')))
-            await asyncio.sleep(0.2)
-            await msg.delete()
-            await message.delete()
+    restartRequested = True
+    await client.close()
+
+def parseId(text):
+    # plain ids and <@mentions> both work
+    return int(text.strip().strip('<@!>'))
+
+@router.command('?del', check=byUsers(790909302566813717))
+async def deleteCommand(message, args):
+    # ?del id[, id...] | ?del range <id> <id> | ?del last <n> | ?del author <user> [n] | ?del pattern <regex>
+    parts = args.split()
+    mode = parts[0].lower() if parts else ''
+    try:
+        if mode == 'range' and len(parts) == 3:
+            low, high = sorted((parseId(parts[1]), parseId(parts[2])))
+            ids = [low]
+            # oldest first, one past the cap to tell a full range from a cut short one
+            async for msg in message.channel.history(limit=purgeMax + 1, after=discord.Object(id=low), before=discord.Object(id=high)):
+                ids.append(msg.id)
+            if len(ids) > purgeMax + 1:
+                # keep it one unbroken stretch from the low end, running it again picks up the rest
+                deleter.delete(message.channel, ids[:purgeMax])
+                await message.channel.send(f'Range has more than {purgeMax} messages, deleted the oldest {purgeMax}. Run it again for the rest')
+            else:
+                deleter.delete(message.channel, ids + [high])
+        elif mode == 'last' and len(parts) == 2:
+            await deleter.purge(message.channel, min(int(parts[1]), purgeMax), before=message)
+        elif mode == 'author' and len(parts) in (2, 3):
+            author = parseId(parts[1])
+            limit = min(int(parts[2]), purgeMax) if len(parts) == 3 else purgeScan
+            await deleter.purge(message.channel, limit, before=message, check=lambda msg: msg.author.id == author)
+        elif mode == 'pattern' and len(parts) >= 2:
+            pattern = re.compile(args.split(None, 1)[1], re.IGNORECASE)
+            await deleter.purge(message.channel, purgeScan, before=message, check=lambda msg: pattern.search(msg.content))
         else:
-            mess = message.content.replace('?del', '').split(', ')
-            await asyncio.sleep(0.2)
-            for id in mess:
-                msg = await message.channel.fetch_message(int(id))
-                await msg.delete()
-            await message.delete()
-
-keep_alive()
-
-try:
-    client.run(TOKEN)
-except:
-    print(f'\n\n\nERROR OCCURED WHILST CONNECTING TO DISCORD API: {traceback.print_exc()}\nRESTARTING NOW\n\n\n')
-    os.system('python restarting.py')
-    os.system("kill 1")
+            deleter.delete(message.channel, [parseId(i) for i in args.split(',') if i.strip()])
+    except (ValueError, re.error):
+        await message.channel.send('Usage: ?del id[, id...] | ?del range <id> <id> | ?del last <n> | ?del author <user> [n] | ?del pattern <regex>')
+        return
+    deleter.delete(message.channel, [message.id])
+
+@client.event
+@timedEvent
+async def on_message(message):
+    if message.author == client.user:
+        return
+    await router.dispatch(message)
+
+async def supervise(baseDelay=2, maxDelay=300):
+    # keeps the bot connected without ever leaving the process: discord.py reconnects dropped
+    # gateways itself, this catches everything it gives up on (and ?restart) and starts over
+    global restartRequested
+    restoreState()
+    failures = 0
+    try:
+        while True:
+            try:
+                await client.start(TOKEN)
+                if not restartRequested:
+                    return
+                failures = 0
+            except discord.LoginFailure:
+                raise # bad token, no amount of retrying fixes that
+            except Exception:
+                failures += 1
+                print(f'\n\n\nERROR OCCURED WHILST CONNECTING TO DISCORD API (attempt {failures}):')
+                traceback.print_exc()
+            saveState(force=True)
+            if not client.is_closed():
+                await client.close()
+            client.clear()
+            delay = 0 if restartRequested else min(maxDelay, baseDelay * 2 ** failures) * random.uniform(0.5, 1.5)
+            restartRequested = False
+            print(f'Reconnecting in {delay:.1f}s')
+            await asyncio.sleep(delay)
+    finally:
+        saveState(force=True)
+        await statusService.stop()
+
+if __name__ == '__main__':
+    keep_alive()
+
+    supervisor = client.loop.create_task(supervise())
+    try:
+        client.loop.run_until_complete(supervisor)
+    except KeyboardInterrupt:
+        # let supervise() unwind so its finally still saves the state and stops the poller
+        supervisor.cancel()
+        client.loop.run_until_complete(asyncio.gather(supervisor, return_exceptions=True))
+        client.loop.run_until_complete(client.close())
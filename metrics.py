@@ -0,0 +1,211 @@
+import asyncio, collections, functools, logging, sys, threading, time
+
+# counters and latency histograms for the bot, rendered in the prometheus text format by
+# keepalive's /metrics. the flask threads read while the event loop writes, hence the lock
+
+defaultBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_lock = threading.Lock()
+_registry = []
+
+def _labelText(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = collections.defaultdict(float)
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_labelText(key)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, buckets=defaultBuckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {} # labels -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, data in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, data):
+                lines.append(f'{self.name}_bucket{_labelText(key + (("le", bound),))} {count}')
+            lines.append(f'{self.name}_bucket{_labelText(key + (("le", "+Inf"),))} {data[-1]}')
+            lines.append(f'{self.name}_sum{_labelText(key)} {data[-2]}')
+            lines.append(f'{self.name}_count{_labelText(key)} {data[-1]}')
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+def render():
+    with _lock:
+        lines = [line for metric in _registry for line in metric.render()]
+    return '\n'.join(lines) + '\n'
+
+handlerSeconds = Histogram('milkybot_handler_seconds', 'Time spent in a command or trigger handler')
+eventSeconds = Histogram('milkybot_event_seconds', 'Time spent in a discord event handler')
+statusPollSeconds = Histogram('milkybot_status_poll_seconds', 'Time taken by a server status poll')
+statusPollErrors = Counter('milkybot_status_poll_errors_total', 'Status polls where every backend failed')
+roleScanSeconds = Histogram('milkybot_role_scan_seconds', 'Time taken by a full guild role scan')
+discordRequests = Counter('milkybot_discord_requests_total', 'Discord REST calls, by method, route and result')
+outboxActions = Counter('milkybot_outbox_actions_total', 'Outbox sends and reactions, by kind and result')
+discordRateLimits = Counter('milkybot_discord_ratelimits_total', 'Rate limits reported by discord.py')
+loopLagSeconds = Histogram('milkybot_event_loop_lag_seconds', 'How late the event loop woke up a sleeping task',
+                           (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+def timedEvent(fn):
+    # wraps a @client.event handler, keeps the name so discord.py still knows which event it is
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with eventSeconds.time(event=fn.__name__):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+class _RateLimitLog(logging.Handler):
+    # discord.py handles 429s itself and only tells the logger about them
+    def emit(self, record):
+        if 'rate limited' in record.getMessage():
+            discordRateLimits.inc()
+
+def watchRateLimits():
+    logger = logging.getLogger('discord.http')
+    if not any(isinstance(h, _RateLimitLog) for h in logger.handlers):
+        logger.addHandler(_RateLimitLog(logging.WARNING))
+
+def watchRequests(http):
+    # every REST call discord.py makes (sends, replies, uploads, deletes...) goes through
+    # HTTPClient.request, so count them there instead of at each call site
+    if getattr(http.request, 'counted', False):
+        return
+    request = http.request
+
+    @functools.wraps(request)
+    async def counted(route, **kwargs):
+        result = 'ok'
+        try:
+            return await request(route, **kwargs)
+        except asyncio.CancelledError:
+            result = 'cancelled'
+            raise
+        except Exception as e:
+            result = str(getattr(e, 'status', None) or type(e).__name__)
+            raise
+        finally:
+            discordRequests.inc(method=route.method, route=route.path, result=result)
+    counted.counted = True
+    http.request = counted
+
+_lagTask = None
+
+def watchLoopLag(every=0.5):
+    global _lagTask
+    async def run():
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(every)
+            loopLagSeconds.observe(max(0.0, loop.time() - start - every))
+    if _lagTask is None or _lagTask.done():
+        _lagTask = asyncio.ensure_future(run())
+    return _lagTask
+
+class Profiler:
+    # sampling profiler for the event loop thread: a side thread grabs the loop thread's
+    # stack every `interval` seconds while it's switched on. costs nothing while it's off
+    def __init__(self, interval=0.005, depth=30):
+        self.interval = interval
+        self.depth = depth
+        self.target = None
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, target=None, interval=None):
+        if self.running:
+            return False
+        self.target = target or self.target or threading.main_thread().ident
+        if interval:
+            self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        return True
+
+    def reset(self):
+        with _lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            with _lock:
+                self.stacks[key] += 1
+                self.samples += 1
+
+    def report(self, top=30):
+        # collapsed stacks, the format flamegraph.pl / speedscope read
+        with _lock:
+            lines = [f'{stack} {count}' for stack, count in self.stacks.most_common(top)]
+            samples = self.samples
+        return f'# {samples} samples every {self.interval * 1000:g}ms, running={self.running}\n' + '\n'.join(lines) + '\n'
+
+profiler = Profiler()
@@ -0,0 +1,111 @@
+import asyncio, collections, random, time
+from metrics import outboxActions
+
+# everything the bot sends in the background goes through here: one queue per channel
+# (and one for reactions), paced to discord's per-channel buckets so we wait a little
+# instead of running into 429s, merged where it makes sense and retried when it fails
+
+giveUp = (400, 403, 404) # retrying these won't change anything
+maxLength = 2000
+
+class _Item:
+    def __init__(self, action=None, line=None, fmt=None):
+        self.action = action
+        self.line = line
+        self.fmt = fmt
+        self.future = asyncio.get_event_loop().create_future()
+
+class Bucket:
+    # at most `rate` calls per `per` seconds
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.calls = collections.deque()
+
+    def delay(self, now):
+        while self.calls and now - self.calls[0] >= self.per:
+            self.calls.popleft()
+        if len(self.calls) < self.rate:
+            return 0
+        return self.per - (now - self.calls[0])
+
+    async def take(self):
+        wait = self.delay(time.monotonic())
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.delay(time.monotonic())
+        self.calls.append(time.monotonic())
+
+class Outbox:
+    def __init__(self, sendRate=(5, 5.0), reactRate=(4, 1.0), retries=5, maxBackoff=60):
+        self.sendRate = sendRate
+        self.reactRate = reactRate
+        self.retries = retries
+        self.maxBackoff = maxBackoff
+        self._queues = {} # (channel id, kind) -> deque of _Item
+        self._buckets = {}
+        self._workers = {}
+
+    def send(self, channel, content=None, merge=None, **kwargs):
+        # merge is a format string like '```diff\n{}\n```': queued lines with the same
+        # format that are waiting together go out as one message
+        if merge is not None:
+            item = _Item(line=content, fmt=merge)
+        else:
+            item = _Item(action=lambda: channel.send(content, **kwargs))
+        return self._push(channel, 'send', item)
+
+    def react(self, message, emojis):
+        # reactions keep their order but don't hold up whoever asked for them
+        futures = [self._push(message.channel, 'react', _Item(action=lambda e=emoji: message.add_reaction(e))) for emoji in emojis]
+        return asyncio.gather(*futures)
+
+    def _push(self, channel, kind, item):
+        key = (channel.id, kind)
+        self._queues.setdefault(key, collections.deque()).append(item)
+        if key not in self._buckets:
+            self._buckets[key] = Bucket(*(self.sendRate if kind == 'send' else self.reactRate))
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = asyncio.ensure_future(self._work(key, channel))
+        return item.future
+
+    def _next(self, queue, channel):
+        item = queue.popleft()
+        if item.fmt is None:
+            return item.action, [item]
+        lines = [item.line]
+        items = [item]
+        while queue and queue[0].fmt == item.fmt and len(item.fmt.format('\n'.join(lines + [queue[0].line]))) <= maxLength:
+            items.append(queue.popleft())
+            lines.append(items[-1].line)
+        content = item.fmt.format('\n'.join(lines))
+        return (lambda: channel.send(content)), items
+
+    async def _work(self, key, channel):
+        queue = self._queues[key]
+        bucket = self._buckets[key]
+        while queue:
+            action, items = self._next(queue, channel)
+            result = None
+            for attempt in range(self.retries + 1):
+                await bucket.take()
+                try:
+                    result = await action()
+                    outboxActions.inc(kind=key[1], result='ok')
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    status = getattr(e, 'status', None)
+                    if status in giveUp or attempt == self.retries:
+                        outboxActions.inc(kind=key[1], result='dropped')
+                        print(f'Dropping outgoing {key[1]} to channel {key[0]} after {attempt + 1} tries: {e!r}')
+                        break
+                    outboxActions.inc(kind=key[1], result='retried')
+                    retryAfter = getattr(e, 'retry_after', None)
+                    delay = retryAfter if retryAfter else min(2 ** attempt, self.maxBackoff)
+                    await asyncio.sleep(delay + random.uniform(0, 0.5))
+            for item in items:
+                if not item.future.done():
+                    item.future.set_result(result)
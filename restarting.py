@@ -1,4 +0,0 @@
-from time import sleep
-from os import system
-sleep(7)
-system('python main.py')
\ No newline at end of file
@@ -0,0 +1,95 @@
+import json
+from metrics import roleScanSeconds
+from state import atomicWrite
+
+# keeps the list of members with one of the interested roles in memory,
+# the guild is only scanned once and after that the member/user events keep it current
+
+interestedRoles = {954349361154900049, 973177697461239828, 991732194483654677, 970767639691546755, 1046194175885971456, 1040337661581344909}
+
+def filterString(_string):
+    return ''.join(i for i in _string if (i.isascii() and i.isalnum()) or i == ' ')
+
+def hasInterestedRole(member):
+    return any(role.id in interestedRoles for role in member.roles)
+
+def userEntry(user):
+    return {
+        "name": filterString(str(user.name)),
+        "discriminator": str(user.discriminator),
+        "id": filterString(str(user.id)),
+        "avatar": str(user.avatar),
+    }
+
+class RoleIndex:
+    def __init__(self, path="./data/users.json"):
+        self.path = path
+        self.users = {} # user id -> entry, insertion order is the guild order from the first scan
+        self.dirty = False
+        self.listeners = [] # called with the user list every time it actually changes
+
+    def load(self):
+        # users.json doubles as the index's snapshot, so a restart starts from the last
+        # known list until the guild has been scanned again
+        try:
+            with open(self.path) as f:
+                users = {int(entry["id"]): entry for entry in json.load(f)["users"]}
+        except (OSError, ValueError, KeyError):
+            return False
+        self.users = users
+        self.dirty = False
+        for listener in list(self.listeners):
+            listener(self.userList())
+        return True
+
+    def build(self, guild):
+        with roleScanSeconds.time():
+            users = {}
+            for member in guild.members:
+                if hasInterestedRole(member):
+                    users[member.id] = userEntry(member)
+        if users != self.users:
+            self.users = users
+            self.dirty = True
+        return self.flush()
+
+    def _set(self, user):
+        entry = userEntry(user)
+        if self.users.get(user.id) != entry:
+            self.users[user.id] = entry
+            self.dirty = True
+
+    def _drop(self, userId):
+        if self.users.pop(userId, None) is not None:
+            self.dirty = True
+
+    def updateMember(self, member):
+        if hasInterestedRole(member):
+            self._set(member)
+        else:
+            self._drop(member.id)
+        return self.flush()
+
+    def removeMember(self, member):
+        self._drop(member.id)
+        return self.flush()
+
+    def updateUser(self, user):
+        # name / avatar changes come through on_user_update, roles don't
+        if user.id in self.users:
+            self._set(user)
+        return self.flush()
+
+    def userList(self):
+        return list(self.users.values())
+
+    def flush(self):
+        if not self.dirty:
+            return False
+        userList = self.userList()
+        _data = '{ "users": ' + json.dumps(userList) + '}'
+        atomicWrite(self.path, _data)
+        self.dirty = False
+        for listener in list(self.listeners):
+            listener(userList)
+        return True
@@ -0,0 +1,115 @@
+import re, time
+from metrics import handlerSeconds
+
+# command registry for on_message
+# prefix commands are looked up by their first word in a dict, substring triggers are all
+# compiled into one regex so a message is scanned once no matter how many triggers there are
+
+def inChannel(*channelIds):
+    channelIds = frozenset(channelIds)
+    return lambda message: message.channel.id in channelIds
+
+def byUsers(*userIds):
+    userIds = frozenset(userIds)
+    return lambda message: message.author.id in userIds
+
+def allOf(*checks):
+    return lambda message: all(check(message) for check in checks)
+
+def trieRegex(words):
+    # one alternation per shared prefix instead of one per word, so the regex engine
+    # doesn't retry every trigger at every position of the message
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        if list(node) == ['']:
+            return ''
+        alts = [re.escape(ch) + build(node[ch]) for ch in sorted(node) if ch]
+        if len(alts) == 1 and '' not in node:
+            return alts[0]
+        pattern = '(?:' + '|'.join(alts) + ')'
+        return pattern + '?' if '' in node else pattern
+
+    return build(trie) if words else r'(?!)'
+
+class Router:
+    def __init__(self):
+        self.commands = {} # '?sus' -> (handler, check)
+        self.triggers = {} # lowercased text -> [(handler, check, word, exact)]
+        self._matcher = None
+
+    def command(self, *names, check=None):
+        def register(handler):
+            for name in names:
+                self.commands[name] = (handler, check)
+            return handler
+        return register
+
+    def trigger(self, *texts, word=False, caseSensitive=False, check=None):
+        # texts are matched anywhere in the lowercased message,
+        # word=True only counts them as a whole word like `text in content.split(" ")`,
+        # caseSensitive=True only counts them when the message has them exactly as written
+        def register(handler):
+            for text in texts:
+                exact = text if caseSensitive else None
+                self.triggers.setdefault(text.lower(), []).append((handler, check, word, exact))
+            self._matcher = None
+            return handler
+        return register
+
+    def _compile(self):
+        # in a lookahead so the scan stops at every position instead of skipping past a match,
+        # one trigger can't hide another that overlaps it ('wowzanetti' has wowza and zanetti)
+        self._matcher = re.compile('(?=(' + trieRegex(list(self.triggers)) + '))')
+        return self._matcher
+
+    def resolve(self, message):
+        # returns the (handler, args) pairs to run for this message, command first then
+        # triggers in the order they show up in the message, each handler at most once
+        content = message.content
+        calls = []
+
+        parts = content.split(None, 1)
+        if parts:
+            entry = self.commands.get(parts[0])
+            if entry is not None and (entry[1] is None or entry[1](message)):
+                calls.append((entry[0], parts[1] if len(parts) > 1 else ''))
+
+        matcher = self._matcher or self._compile()
+        lowered = content.lower()
+        sameLength = len(lowered) == len(content) # lower() can grow some characters, then positions don't line up
+        seen = set()
+        for match in matcher.finditer(lowered):
+            start = match.start()
+            longest = match.group(1)
+            # the regex gives the longest trigger starting here, any shorter one starting
+            # here is a prefix of it
+            for end in range(start + 1, start + len(longest) + 1):
+                entries = self.triggers.get(lowered[start:end])
+                if entries is None:
+                    continue
+                isWord = (start == 0 or lowered[start - 1] == ' ') and (end == len(lowered) or lowered[end] == ' ')
+                for handler, check, word, exact in entries:
+                    if exact is not None and not (content[start:end] == exact if sameLength else exact in content):
+                        continue
+                    if (word and not isWord) or handler in seen or (check is not None and not check(message)):
+                        continue
+                    seen.add(handler)
+                    calls.append((handler, None))
+        return calls
+
+    async def dispatch(self, message):
+        for handler, args in self.resolve(message):
+            start = time.perf_counter()
+            try:
+                if args is None:
+                    await handler(message)
+                else:
+                    await handler(message, args)
+            finally:
+                handlerSeconds.observe(time.perf_counter() - start, handler=handler.__name__)
@@ -0,0 +1,42 @@
+import json, os, tempfile, time
+
+# small bits of bot state that should survive a restart, kept in one json file
+
+def atomicWrite(path, text):
+    # write next to the real file then rename over it, readers never see half a file
+    folder = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.' + os.path.basename(path) + '-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+class StateFile:
+    def __init__(self, path='./data/state.json', heartbeat=300):
+        self.path = path
+        self.heartbeat = heartbeat # unchanged state still gets rewritten this often to move 'saved' along
+        self._last = None
+        self._written = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, data, force=False):
+        # skips the write when nothing changed since last time, unless forced (on the way out)
+        # or the heartbeat is due. 'saved' says when the state was last known to be right,
+        # so it has to keep moving even while the state stays the same
+        text = json.dumps(data, sort_keys=True)
+        now = time.time()
+        if text == self._last and not force and now - self._written < self.heartbeat:
+            return False
+        atomicWrite(self.path, json.dumps(dict(data, saved=now), sort_keys=True))
+        self._last = text
+        self._written = now
+        return True
@@ -0,0 +1,192 @@
+import asyncio, time, traceback
+import aiohttp
+from metrics import statusPollSeconds, statusPollErrors
+
+# one poller for the whole bot, everything else just reads status.snapshots
+# so nothing touches the network from inside a command or the presence loop
+
+class StatusSnapshot:
+    def __init__(self, online, count, players, mods, fetched, source=None, partial=None):
+        self.online = online
+        self.count = count
+        self.players = players
+        self.mods = mods
+        self.fetched = fetched
+        self.source = source
+        # the server only hands out a sample of up to 12 names, so with more players online
+        # than that the list is missing people and can't be diffed for joins and leaves
+        self.partial = count > len(players) if partial is None else partial
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['online'], data['count'], data['players'], data['mods'], data['fetched'], data.get('source'), data.get('partial'))
+
+def parseApi(pars):
+    # api.mcsrvstat.us leaves keys out when they're empty, so dig carefully
+    online = bool(pars.get('online'))
+    count = 0
+    players = []
+    mods = []
+    if online:
+        count = int(pars.get('players', {}).get('online', 0))
+        players = list(pars.get('players', {}).get('list', []))
+        mods = list(pars.get('mods', {}).get('names', []))
+    return StatusSnapshot(online, count, players, mods, time.time(), 'api')
+
+anonymous = '00000000-0000-0000-0000-000000000000'
+
+def modsFromRaw(raw):
+    # forge puts its mod list in the status json, 'modinfo' up to 1.12 and 'forgeData' after
+    if 'modinfo' in raw:
+        return [mod.get('modid', '?') for mod in raw['modinfo'].get('modList', [])]
+    if 'forgeData' in raw:
+        return [mod.get('modId', '?') for mod in raw['forgeData'].get('mods', [])]
+    return []
+
+class ApiBackend:
+    # the http status api, slow to notice changes since it caches but works through anything
+    name = 'api'
+
+    def __init__(self, url='https://api.mcsrvstat.us/2/{address}'):
+        self.url = url
+
+    async def fetch(self, service, address):
+        async with service.session().get(self.url.format(address=address)) as resp:
+            resp.raise_for_status()
+            pars = await resp.json(content_type=None)
+        return parseApi(pars)
+
+class NativeBackend:
+    # talks to the server directly: server list ping for the status and the mods,
+    # and the query protocol for the full player list when the ping sample is cut short
+    name = 'native'
+
+    def __init__(self, timeout=3, query=True, queryCooldown=600):
+        self.timeout = timeout
+        self.query = query
+        self.queryCooldown = queryCooldown # most servers have query off, don't ask every time
+        self._servers = {}
+        self._noQuery = {}
+
+    async def _server(self, address):
+        server = self._servers.get(address)
+        if server is None:
+            from mcstatus import JavaServer
+            server = await JavaServer.async_lookup(address, timeout=self.timeout)
+            self._servers[address] = server
+        return server
+
+    async def fetch(self, service, address):
+        server = await self._server(address)
+        try:
+            status = await server.async_status()
+        except Exception:
+            # the address might have moved (srv record), look it up again next time
+            self._servers.pop(address, None)
+            raise
+        count = status.players.online
+        players = [p.name for p in status.players.sample or [] if p.id != anonymous]
+        if self.query and count > len(players) and time.monotonic() >= self._noQuery.get(address, 0):
+            try:
+                players = list((await server.async_query()).players.names)
+            except Exception:
+                self._noQuery[address] = time.monotonic() + self.queryCooldown
+        return StatusSnapshot(True, count, players, modsFromRaw(status.raw), time.time(), 'native')
+
+class StatusService:
+    def __init__(self, servers, backends=None, interval=5, timeout=10, maxBackoff=300):
+        self.servers = list(servers)
+        self.primary = self.servers[0]
+        self.backends = backends or [ApiBackend()] # tried in order, the first one that answers wins
+        self.interval = interval
+        self.timeout = timeout
+        self.maxBackoff = maxBackoff
+        self.snapshots = {}
+        self.failures = {}
+        self.listeners = [] # async callbacks, called with (server, old, new) after every successful poll
+        self._session = None
+        self._tasks = {}
+
+    @property
+    def snapshot(self):
+        return self.snapshots.get(self.primary)
+
+    def start(self):
+        # on_ready fires again on every reconnect, only ever run one poller per server
+        for server in self.servers:
+            task = self._tasks.get(server)
+            if task is None or task.done():
+                self._tasks[server] = asyncio.ensure_future(self._run(server))
+        return list(self._tasks.values())
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        self._tasks = {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=4, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def fetch(self, server):
+        # a snapshot with only part of the player list doesn't win, the next backend gets
+        # a go and the partial one is only used when nothing better answers
+        error = None
+        partial = None
+        for backend in self.backends:
+            try:
+                snapshot = await asyncio.wait_for(backend.fetch(self, server), self.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+                continue
+            if not snapshot.partial:
+                return snapshot
+            partial = partial or snapshot
+        if partial is not None:
+            return partial
+        raise error
+
+    async def poll(self, server):
+        with statusPollSeconds.time(server=server):
+            new = await self.fetch(server)
+        old = self.snapshots.get(server)
+        self.snapshots[server] = new
+        for listener in list(self.listeners):
+            try:
+                await listener(server, old, new)
+            except Exception:
+                traceback.print_exc()
+        return new
+
+    def nextDelay(self, server):
+        failures = self.failures.get(server, 0)
+        if failures == 0:
+            return self.interval
+        return min(self.interval * 2 ** failures, self.maxBackoff)
+
+    async def _run(self, server):
+        while True:
+            try:
+                await self.poll(server)
+                self.failures[server] = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures[server] = self.failures.get(server, 0) + 1
+                statusPollErrors.inc(server=server)
+                print(f'Status poll for {server} failed ({self.failures[server]} in a row): {e!r}')
+            await asyncio.sleep(self.nextDelay(server))